@@ -1,62 +1,257 @@
 # server.py - Odiadev TTS (Fixed)
-import os, asyncio, tempfile, logging, json, re
+import os, sys, asyncio, logging, re, time, hashlib, ssl
 from typing import Optional
-from datetime import datetime
-from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import FileResponse, JSONResponse
+from collections import OrderedDict
+from functools import lru_cache
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.utils import is_body_allowed_for_status_code
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from starlette.exceptions import HTTPException as StarletteHTTPException
 import edge_tts
+import certifi
+import httpx
+import orjson
+try:
+    from openai import AsyncOpenAI
+except ImportError:
+    AsyncOpenAI = None
+import numpy as np
 
 ENV = os.getenv("ENV", "production")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 TTS_VOICE_DEFAULT = os.getenv("TTS_VOICE", "en-NG-EzinneNeural")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
+SEMCACHE_THRESHOLD = float(os.getenv("SEMCACHE_THRESHOLD", "0.9"))
+SEMCACHE_MAX = int(os.getenv("SEMCACHE_MAX", "1024"))
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+TTS_CACHE_MAX = int(os.getenv("TTS_CACHE_MAX", "256"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+TTS_CACHE_ENTRY_MAX_BYTES = int(os.getenv("TTS_CACHE_ENTRY_MAX_BYTES", str(512 * 1024)))
+TTS_RPS = float(os.getenv("TTS_RPS", "10"))
+TTS_BURST = max(1, int(os.getenv("TTS_BURST", "1")))
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "8"))
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "30"))
 
 logging.basicConfig(level=getattr(logging, LOG_LEVEL, logging.INFO), format="%(levelname)s [%(asctime)s] %(message)s")
 log = logging.getLogger("odiadev")
 
-app = FastAPI(title="Odiadev TTS", description="Voice AI by odia.dev", version="2.0.0")
+# Structured log payload that is only serialized if a handler actually formats the record.
+class LazyJson:
+    __slots__ = ("fields",)
+    def __init__(self, fields: dict):
+        self.fields = fields
+    def __str__(self):
+        return orjson.dumps(self.fields).decode()
+
+app = FastAPI(title="Odiadev TTS", description="Voice AI by odia.dev", version="2.0.0", default_response_class=ORJSONResponse)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+# GZipMiddleware that never touches audio/* responses: MP3 is already compressed, and gzipping a stream
+# would also hold frames back in the compressor.
+class _AudioSafeGZipResponder(GZipResponder):
+    passthrough = False
+
+    async def send_with_gzip(self, message):
+        if message["type"] == "http.response.start":
+            self.passthrough = Headers(raw=message["headers"]).get("content-type", "").startswith("audio/")
+        if self.passthrough: await self.send(message)
+        else: await super().send_with_gzip(message)
+
+class AudioSafeGZipMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            return await _AudioSafeGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)(scope, receive, send)
+        await self.app(scope, receive, send)
+
+app.add_middleware(AudioSafeGZipMiddleware, minimum_size=500)
+
+# Error bodies go through orjson too (FastAPI's default handlers always use the stdlib JSONResponse).
+@app.exception_handler(StarletteHTTPException)
+async def http_error(request, exc: StarletteHTTPException):
+    if not is_body_allowed_for_status_code(exc.status_code): return Response(status_code=exc.status_code, headers=exc.headers)
+    return ORJSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+
+@app.exception_handler(RequestValidationError)
+async def validation_error(request, exc: RequestValidationError):
+    return ORJSONResponse({"detail": jsonable_encoder(exc.errors())}, status_code=422)
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_NON_ASCII = re.compile(r'[^\x00-\x7F]+')
+_WS = re.compile(r'\s+')
+_PCT_RE = re.compile(r'^\s*([+-]?\d+(?:\.\d+)?)\s*%?\s*$')
+_DEFAULT_PCT = "+0%"
+_ZERO_PCT = frozenset({"+0%", "0%", "-0%", "0"})
+
+_MP3_HEADERS = {"Cache-Control": "public, max-age=3600", "Content-Disposition": 'inline; filename="speech.mp3"'}
+_MP3_HIT_HEADERS = {**_MP3_HEADERS, "X-Cache": "HIT"}
+_MP3_MISS_HEADERS = {**_MP3_HEADERS, "X-Cache": "MISS", "X-Accel-Buffering": "no"}
+_MP3_LIVE_HEADERS = {**_MP3_HEADERS, "Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
 
 def clean_text_for_tts(text: str) -> str:
-    text = re.sub(r'[^\x00-\x7F]+', ' ', text)
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+    if not text.isascii(): text = _NON_ASCII.sub(' ', text)
+    return _WS.sub(' ', text).strip()
+
+# Edge-TTS wants a signed integer percentage ("+0%", "-10%"); clients send a handful of distinct values.
+def normalize_percent(value: Optional[str], default: str = _DEFAULT_PCT) -> str:
+    if not value: return default
+    if value in _ZERO_PCT: return _DEFAULT_PCT
+    return _parse_percent(value, default)
+
+@lru_cache(maxsize=128)
+def _parse_percent(value: str, default: str) -> str:
+    m = _PCT_RE.match(value)
+    if not m: return default
+    val = int(float(m.group(1)))
+    return f"+{val}%" if val >= 0 else f"{val}%"
+
+_http: Optional[httpx.AsyncClient] = None
+
+@app.on_event("startup")
+def open_http_pool():
+    global _http
+    _http = httpx.AsyncClient(limits=httpx.Limits(max_connections=100, max_keepalive_connections=100, keepalive_expiry=60))
+
+@app.on_event("shutdown")
+async def close_http_pool():
+    if _http: await _http.aclose()
 
 _oai = None
-def get_openai_client():
+_oai_lock = asyncio.Lock()
+async def get_openai_client():
     global _oai
-    if _oai is False: return None
-    if _oai is None and OPENAI_API_KEY:
-        try:
-            from openai import OpenAI
-            _oai = OpenAI(api_key=OPENAI_API_KEY)
-            log.info("OpenAI ready")
-        except Exception as e:
-            log.error(f"OpenAI failed: {e}")
-            _oai = False
-    return _oai
+    if _oai is not None or not OPENAI_API_KEY: return _oai or None
+    async with _oai_lock:
+        if _oai is None:
+            try:
+                if AsyncOpenAI is None: raise RuntimeError("openai package not installed")
+                _oai = await asyncio.to_thread(AsyncOpenAI, api_key=OPENAI_API_KEY, http_client=_http)
+                log.info("OpenAI ready")
+            except Exception as e:
+                log.error(f"OpenAI failed: {e}")
+                _oai = False
+    return _oai or None
+
+@app.on_event("startup")
+async def init_openai():
+    await get_openai_client()
+
+# Static system prompts, built once at import and always sent first so they form a stable prefix for
+# OpenAI's automatic prompt cache; never put per-request values (dates, ids, user text) in here.
+_SYSTEM_MESSAGES = {k: {"role": "system", "content": v} for k, v in {
+    "lexi": "You are Lexi from odia.dev, Nigeria's WhatsApp automation assistant. Be helpful and concise. Never use emojis.",
+    "miss": "You are MISS from Mudiame University. Provide academic support. Never use emojis.",
+    "atlas": "You are Atlas, Odiadev's luxury concierge. Be sophisticated. Never use emojis.",
+    "legal": "You are Miss Legal, Odiadev's legal assistant. Be professional. Never use emojis."
+}.items()}
+_VALID_AGENTS = frozenset(_SYSTEM_MESSAGES)
 
 class AgentIn(BaseModel):
     message: Optional[str] = None
     text: Optional[str] = None
     agent: Optional[str] = "lexi"
 
+    @model_validator(mode="after")
+    def canonicalize(self):
+        self.message = (self.message or self.text or "").strip()
+        if not self.message: raise ValueError("Message required")
+        self.agent = self.agent or "lexi"
+        if self.agent not in _VALID_AGENTS: raise ValueError(f"Unknown agent: {self.agent}")
+        return self
+
 class AgentOut(BaseModel):
+    model_config = ConfigDict(frozen=True)
     reply: str
     mode: str
     agent: str
     error: Optional[str] = None
     timestamp: str
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = datetime.now()
-    response = await call_next(request)
-    latency_ms = int((datetime.now() - start_time).total_seconds() * 1000)
-    log.info(json.dumps({"method": request.method, "path": request.url.path, "status": response.status_code, "latency_ms": latency_ms}))
-    return response
+# Semantic reply cache, per agent: a preallocated matrix of unit-norm prompt embeddings, the reply for each
+# row and a last-used tick per row. Rows are never reordered; a full cache overwrites its least recently used row.
+class SemCache:
+    __slots__ = ("vecs", "replies", "used", "size")
+    def __init__(self, dim: int):
+        self.vecs = np.zeros((SEMCACHE_MAX, dim), dtype=np.float32)
+        self.replies: list[Optional[AgentOut]] = [None] * SEMCACHE_MAX
+        self.used = np.zeros(SEMCACHE_MAX, dtype=np.int64)
+        self.size = 0
+
+_sem_cache: dict[str, SemCache] = {}
+_sem_tick = 0
+
+async def sem_embed(client, text: str) -> Optional[np.ndarray]:
+    if SEMCACHE_THRESHOLD <= 0: return None
+    try:
+        vec = np.asarray((await client.embeddings.create(model=EMBED_MODEL, input=text)).data[0].embedding, dtype=np.float32)
+    except Exception as e:
+        log.error(f"Embedding failed: {e}")
+        return None
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else None
+
+def sem_get(agent_type: str, q: Optional[np.ndarray]) -> Optional[AgentOut]:
+    global _sem_tick
+    cache = _sem_cache.get(agent_type)
+    if q is None or cache is None or not cache.size: return None
+    sims = cache.vecs[:cache.size] @ q
+    i = int(np.argmax(sims))
+    if sims[i] < SEMCACHE_THRESHOLD: return None
+    _sem_tick += 1
+    cache.used[i] = _sem_tick
+    return cache.replies[i]
+
+def sem_put(agent_type: str, q: Optional[np.ndarray], out: AgentOut):
+    global _sem_tick
+    if q is None or SEMCACHE_MAX <= 0: return
+    cache = _sem_cache.get(agent_type)
+    if cache is None or cache.vecs.shape[1] != q.shape[0]: cache = _sem_cache[agent_type] = SemCache(q.shape[0])
+    if cache.size < SEMCACHE_MAX:
+        i = cache.size
+        cache.size += 1
+    else:
+        i = int(np.argmin(cache.used))
+    cache.vecs[i] = q
+    cache.replies[i] = out
+    _sem_tick += 1
+    cache.used[i] = _sem_tick
+
+_SILENT_PATHS = frozenset({"/health", "/"})
+
+# Pure ASGI (no BaseHTTPMiddleware task-group overhead); latency is measured to the response start.
+class AccessLogMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD" or scope["path"] in _SILENT_PATHS:
+            return await self.app(scope, receive, send)
+        start = time.perf_counter_ns()
+        status, latency_ms = 500, None
+
+        async def send_wrapper(message):
+            nonlocal status, latency_ms
+            if message["type"] == "http.response.start":
+                status, latency_ms = message["status"], (time.perf_counter_ns() - start) // 1_000_000
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if latency_ms is None: latency_ms = (time.perf_counter_ns() - start) // 1_000_000
+            client = scope.get("client")
+            log.info(LazyJson({"method": scope["method"], "path": scope["path"], "client": client[0] if client else None, "status": status, "latency_ms": latency_ms}))
+
+app.add_middleware(AccessLogMiddleware)
 
 @app.get("/")
 def root():
@@ -64,66 +259,203 @@ def root():
 
 @app.head("/")
 def head_root():
-    return JSONResponse(content="", status_code=200)
+    return Response(status_code=200)
 
 @app.get("/health")
-def health():
+async def health():
     openai_status = "not_configured"
     if OPENAI_API_KEY:
-        client = get_openai_client()
+        client = await get_openai_client()
         openai_status = "ready" if client else "failed"
     return {"status": "ok", "service": "Odiadev TTS", "voice": TTS_VOICE_DEFAULT, "openai": openai_status, "company": "Odiadev"}
 
+# Exact-match MP3 cache for /speak: 16-byte blake2b of (voice, rate, volume, text) -> audio bytes, LRU order.
+# Bounded by entry count and by total bytes; a single MP3 larger than TTS_CACHE_ENTRY_MAX_BYTES is never kept.
+_mp3_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+_mp3_cache_bytes = 0
+_MP3_CACHE_ON = TTS_CACHE_MAX > 0 and TTS_CACHE_MAX_BYTES > 0 and TTS_CACHE_ENTRY_MAX_BYTES > 0
+
+def mp3_cache_put(key: bytes, data: bytes):
+    global _mp3_cache_bytes
+    old = _mp3_cache.pop(key, None)
+    if old is not None: _mp3_cache_bytes -= len(old)
+    _mp3_cache[key] = data
+    _mp3_cache_bytes += len(data)
+    while _mp3_cache and (len(_mp3_cache) > TTS_CACHE_MAX or _mp3_cache_bytes > TTS_CACHE_MAX_BYTES):
+        _mp3_cache_bytes -= len(_mp3_cache.popitem(last=False)[1])
+
+def tts_cache_key(voice: str, rate: str, volume: str, text: str) -> bytes:
+    return hashlib.blake2b("\0".join((voice, rate, volume, text)).encode(), digest_size=16).digest()
+
+# edge-tts 6.1 opens its own aiohttp session per synthesis (no way to pass a shared one) and builds a
+# fresh SSL context from the certifi bundle each time, ~30 ms of blocking CPU. Hand it one prebuilt context.
+# Only applied to the 6.1 line whose code this was checked against; any other ssl.* name still resolves.
+_EDGE_SSL_CTX = ssl.create_default_context(cafile=certifi.where())
+
+class _EdgeSSL:
+    def __getattr__(self, name):
+        return getattr(ssl, name)
+    @staticmethod
+    def create_default_context(*args, **kwargs):
+        return _EDGE_SSL_CTX
+
+if edge_tts.__version__.startswith("6.1."):
+    edge_tts.communicate.ssl = _EdgeSSL()
+
+# Upstream protection for Edge-TTS: GCRA pacing spaces out session starts at TTS_RPS (allowing TTS_BURST
+# back-to-back), the semaphore caps how many synthesis websockets are open at once.
+_TTS_INTERVAL = 1.0 / TTS_RPS if TTS_RPS > 0 else 0.0
+_TTS_TOLERANCE = (TTS_BURST - 1) * _TTS_INTERVAL
+_tts_sem = asyncio.Semaphore(TTS_MAX_CONCURRENCY)
+_tts_tat = 0.0  # theoretical arrival time of the next session start
+
+async def tts_pace():
+    # Reserve a slot and advance the TAT before awaiting; there is no await between the read and the
+    # write, so concurrent callers on the event loop each get a distinct slot without a lock.
+    global _tts_tat
+    now = time.monotonic()
+    tat = max(_tts_tat, now)
+    _tts_tat = tat + _TTS_INTERVAL
+    delay = tat - _TTS_TOLERANCE - now
+    if delay > 0: await asyncio.sleep(delay)
+
+async def audio_chunks(communicate: edge_tts.Communicate):
+    async with _tts_sem:
+        await tts_pace()
+        # Bound every upstream read so a stalled websocket can't pin a semaphore slot forever. The deadline
+        # is per chunk (wait_for), not around the generator, which would cancel whichever task consumes it.
+        it = communicate.stream()
+        try:
+            while True:
+                try: chunk = await asyncio.wait_for(anext(it), TTS_TIMEOUT)
+                except StopAsyncIteration: break
+                if chunk["type"] == "audio": yield chunk["data"]
+        finally:
+            await it.aclose()
+
 @app.get("/speak")
 async def speak(text: str = Query(..., min_length=1, max_length=5000), voice: Optional[str] = None, rate: Optional[str] = None, volume: Optional[str] = None):
     text = clean_text_for_tts(text)
     if not text: raise HTTPException(400, detail="Empty text")
     voice_name = (voice or TTS_VOICE_DEFAULT).strip()
-    if not rate or rate == "0%": rate = "+0%"
-    if not volume or volume == "0%": volume = "+0%"
+    rate, volume = normalize_percent(rate), normalize_percent(volume)
+    key = tts_cache_key(voice_name, rate, volume, text)
+    cached = _mp3_cache.get(key)
+    if cached is not None:
+        _mp3_cache.move_to_end(key)
+        return Response(content=cached, media_type="audio/mpeg", headers=_MP3_HIT_HEADERS)
+    # Wait for the first frame before committing to a 200 so NoAudioReceived & co. still surface as errors.
     try:
-        with tempfile.NamedTemporaryFile(prefix="odiadev_", suffix=".mp3", delete=False) as tmp:
-            tmp_path = tmp.name
-        communicate = edge_tts.Communicate(text=text, voice=voice_name, rate=rate, volume=volume)
-        await communicate.save(tmp_path)
-        return FileResponse(tmp_path, media_type="audio/mpeg", headers={"Cache-Control": "public, max-age=3600", "Content-Disposition": 'inline; filename="speech.mp3"'})
+        stream = audio_chunks(edge_tts.Communicate(text=text, voice=voice_name, rate=rate, volume=volume))
+        first = await anext(stream)
+    except asyncio.TimeoutError:
+        log.error(f"TTS timed out after {TTS_TIMEOUT}s")
+        raise HTTPException(504, detail="tts upstream timeout")
     except Exception as e:
         log.error(f"TTS failed: {e}")
         raise HTTPException(500, detail=str(e))
 
-@app.post("/agent", response_model=AgentOut)
+    async def gen():
+        # Keep a copy for the cache only while the utterance stays under the per-entry limit.
+        size = len(first)
+        chunks = [first] if _MP3_CACHE_ON and size <= TTS_CACHE_ENTRY_MAX_BYTES else None
+        yield first
+        try:
+            async for data in stream:
+                if chunks is not None:
+                    size += len(data)
+                    if size > TTS_CACHE_ENTRY_MAX_BYTES: chunks = None
+                    else: chunks.append(data)
+                yield data
+        except Exception as e:
+            log.error(f"TTS stream failed: {e!r}")
+            return
+        if chunks is not None: mp3_cache_put(key, b"".join(chunks))
+
+    return StreamingResponse(gen(), media_type="audio/mpeg", headers=_MP3_MISS_HEADERS)
+
+# Built in-process, so skip FastAPI's response re-validation; the schema is still documented.
+@app.post("/agent", response_model=None, responses={200: {"model": AgentOut}})
 async def agent(body: AgentIn):
-    user_msg = (body.message or body.text or "").strip()
-    agent_type = body.agent or "lexi"
-    if not user_msg: raise HTTPException(422, detail="Message required")
-    client = get_openai_client()
+    user_msg, agent_type = body.message, body.agent
+    client = await get_openai_client()
     if client:
+        q = await sem_embed(client, user_msg)
+        cached = sem_get(agent_type, q)
+        if cached: return cached.model_copy(update={"timestamp": utc_now()})
         try:
-            prompts = {
-                "lexi": "You are Lexi from odia.dev, Nigeria's WhatsApp automation assistant. Be helpful and concise. Never use emojis.",
-                "miss": "You are MISS from Mudiame University. Provide academic support. Never use emojis.",
-                "atlas": "You are Atlas, Odiadev's luxury concierge. Be sophisticated. Never use emojis.",
-                "legal": "You are Miss Legal, Odiadev's legal assistant. Be professional. Never use emojis."
-            }
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "system", "content": prompts.get(agent_type, prompts["lexi"])}, {"role": "user", "content": user_msg}],
+            response = await client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=[_SYSTEM_MESSAGES[agent_type], {"role": "user", "content": user_msg}],
                 temperature=0.7, max_tokens=250
             )
+            usage = response.usage  # Optional; OpenAI-compatible proxies often omit it
+            if usage:
+                details = getattr(usage, "prompt_tokens_details", None)
+                log.info(LazyJson({"event": "openai_usage", "agent": agent_type, "prompt_tokens": getattr(usage, "prompt_tokens", None), "cached_tokens": getattr(details, "cached_tokens", None)}))
             reply = clean_text_for_tts(response.choices[0].message.content.strip())
-            return AgentOut(reply=reply, mode="ai", agent=agent_type, timestamp=datetime.utcnow().isoformat())
+            out = AgentOut(reply=reply, mode="ai", agent=agent_type, timestamp=utc_now())
+            sem_put(agent_type, q, out)
+            return out
         except Exception as e:
             log.error(f"OpenAI error: {e}")
             error_msg = str(e)[:100]
     else:
         error_msg = "openai_not_configured"
-    return AgentOut(reply=f"[Echo]: {user_msg}", mode="echo", agent=agent_type, error=error_msg, timestamp=datetime.utcnow().isoformat())
+    return AgentOut(reply=f"[Echo]: {user_msg}", mode="echo", agent=agent_type, error=error_msg, timestamp=utc_now())
 
 @app.post("/speak-agent")
 async def speak_agent(body: AgentIn):
-    agent_response = await agent(body)
-    return await speak(text=agent_response.reply)
+    user_msg, agent_type = body.message, body.agent
+    client = await get_openai_client()
+    if not client: return await speak(text=(await agent(body)).reply)
+    q = await sem_embed(client, user_msg)
+    cached = sem_get(agent_type, q)
+    if cached: return await speak(text=cached.reply)
+    try:
+        stream = await client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=[_SYSTEM_MESSAGES[agent_type], {"role": "user", "content": user_msg}],
+            temperature=0.7, max_tokens=250, stream=True
+        )
+    except Exception as e:
+        log.error(f"OpenAI error: {e}")
+        return await speak(text=f"[Echo]: {user_msg}")
+
+    # Speak each sentence as soon as the model finishes it instead of waiting for the full reply.
+    async def speak_sentence(sentence: str):
+        try:
+            async for data in audio_chunks(edge_tts.Communicate(text=sentence, voice=TTS_VOICE_DEFAULT)): yield data
+        except (edge_tts.exceptions.NoAudioReceived, edge_tts.exceptions.UnexpectedResponse) as e:
+            # Content-level failure (e.g. a punctuation-only fragment); skip it and keep speaking the reply.
+            log.error(f"Speak-agent sentence skipped: {e!r}")
+
+    async def gen():
+        buf, spoken = "", []
+        try:
+            async for event in stream:
+                delta = event.choices[0].delta.content if event.choices else None
+                if not delta: continue
+                *done, buf = _SENTENCE_END.split(buf + delta)
+                for sentence in map(clean_text_for_tts, done):
+                    if not sentence: continue
+                    spoken.append(sentence)
+                    async for data in speak_sentence(sentence): yield data
+            tail = clean_text_for_tts(buf)
+            if tail:
+                spoken.append(tail)
+                async for data in speak_sentence(tail): yield data
+            sem_put(agent_type, q, AgentOut(reply=" ".join(spoken), mode="ai", agent=agent_type, timestamp=utc_now()))
+        except Exception as e:
+            log.error(f"Speak-agent stream failed: {e!r}")
+        finally:
+            # Release the pooled OpenAI connection on early exit too (TTS failure, client disconnect, aclose).
+            await stream.close()
+
+    return StreamingResponse(gen(), media_type="audio/mpeg", headers=_MP3_LIVE_HEADERS)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("server:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")), reload=False)
+    # uvloop has no Windows build; uvicorn[standard] installs both uvloop and httptools elsewhere.
+    uvicorn.run("server:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")), reload=False, proxy_headers=True, forwarded_allow_ips="*",
+                loop="asyncio" if sys.platform == "win32" else "uvloop", http="httptools", workers=int(os.getenv("WEB_CONCURRENCY", "1")))
@@ -18,3 +18,29 @@ print("Agent (echo)...", end=" ", flush=True)
 r = requests.post(f"{base}/agent", json={"message":"Hello"}, timeout=10)
 r.raise_for_status()
 print("OK", r.json())
+
+print("Agent (unknown agent -> 422)...", end=" ", flush=True)
+r = requests.post(f"{base}/agent", json={"message":"Hello", "agent":"bogus"}, timeout=10)
+assert r.status_code == 422, f"Expected 422, got {r.status_code}: {r.text}"
+print("OK")
+
+print("Agent (empty message -> 422)...", end=" ", flush=True)
+r = requests.post(f"{base}/agent", json={"message":"   "}, timeout=10)
+assert r.status_code == 422, f"Expected 422, got {r.status_code}: {r.text}"
+print("OK")
+
+# The MP3 cache is per worker process: with WEB_CONCURRENCY > 1 the repeat may land on another
+# worker and miss, so only a HIT is checked and a second MISS (or no X-Cache at all) is skipped.
+print("Speak (repeat -> cache hit)...", end=" ", flush=True)
+params = {"text":f"Cache check {time.time()}"}
+r = requests.get(f"{base}/speak", params=params, timeout=30)
+r.raise_for_status()
+r2 = requests.get(f"{base}/speak", params=params, timeout=30)
+r2.raise_for_status()
+first, repeat = r.headers.get("X-Cache"), r2.headers.get("X-Cache")
+if first != "MISS" or repeat == "MISS":
+    print("SKIP", f"X-Cache {first} -> {repeat} (no cache header or repeat served by another worker)")
+else:
+    assert repeat == "HIT", f"Unexpected X-Cache on repeat: {repeat}"
+    assert r2.content == r.content, "Cached audio differs from the original"
+    print("OK", len(r2.content), "bytes")